@@ -6,11 +6,276 @@ BlackRoad OS - Haptic pattern composition and playback
 import sqlite3
 import json
 from dataclasses import dataclass, field, asdict
-from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 import argparse
+from itertools import accumulate
+from operator import add
 import math
+import re
+from numbers import Integral, Real
+import struct
+from time import time_ns
+
+try:
+    import orjson
+except ImportError:  # optional accelerator
+    orjson = None
+
+
+# Bumped whenever _init_db has to rewrite an existing database
+_SCHEMA_VERSION = 4
+
+# Step data lives in packed struct-of-arrays columns; `sequence` holds JSON
+# for rows written before schema version 1 and for steps that cannot be
+# packed losslessly (see _pack_sequence)
+_SQL_CREATE_PATTERNS = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        category INTEGER NOT NULL,
+        description TEXT,
+        sequence TEXT,
+        seq_types BLOB,
+        seq_durations BLOB,
+        seq_intensities BLOB,
+        seq_pauses BLOB,
+        duration_ms INTEGER,
+        intensity INTEGER,
+        repeat INTEGER DEFAULT 1,
+        created_at INTEGER,
+        preset BOOLEAN DEFAULT 0
+    )
+"""
+
+_SQL_CREATE_PLAYBACK_LOG = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pattern_id TEXT NOT NULL,
+        device TEXT,
+        timestamp INTEGER,
+        duration_ms INTEGER,
+        FOREIGN KEY(pattern_id) REFERENCES patterns(id)
+    )
+"""
+
+# Naive local-time ISO strings (schema < 4) to unix milliseconds
+_SQL_ISO_TO_MS = "CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+
+_SQL_INSERT_PRESET = """
+    INSERT OR IGNORE INTO patterns 
+    (id, name, category, description, seq_types, seq_durations, seq_intensities, seq_pauses,
+     duration_ms, intensity, repeat, preset)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+"""
+
+_SQL_INSERT_PATTERN = """
+    INSERT INTO patterns 
+    (id, name, category, description, sequence, seq_types, seq_durations, seq_intensities,
+     seq_pauses, duration_ms, intensity, repeat, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_SQL_GET_SEQUENCE = """
+    SELECT sequence, seq_types, seq_durations, seq_intensities, seq_pauses, duration_ms
+    FROM patterns WHERE id = ?
+"""
+
+# Fetches source rows in the caller's order (and duplicates) by walking a
+# JSON array of ids with json_each
+_SQL_GET_SEQUENCES = """
+    WITH ids AS (SELECT key AS ord, value AS pid FROM json_each(?))
+    SELECT p.sequence, p.seq_types, p.seq_durations, p.seq_intensities, p.seq_pauses,
+           p.duration_ms
+    FROM ids JOIN patterns p ON p.id = ids.pid
+    ORDER BY ids.ord
+"""
+
+# Slug table for pattern ids: ASCII lowercase and spaces to underscores
+_LOWER_UNDERSCORE = str.maketrans({
+    " ": "_", **{chr(c): chr(c + 32) for c in range(ord("A"), ord("Z") + 1)}
+})
+
+_SQL_INSERT_PLAYBACK = """
+    INSERT INTO playback_log (pattern_id, device, timestamp, duration_ms)
+    VALUES (?, ?, ?, ?)
+"""
+
+_SQL_GET_PATTERN = """
+    SELECT id, name, category, description, sequence, duration_ms, intensity, repeat,
+           seq_types, seq_durations, seq_intensities, seq_pauses
+    FROM patterns WHERE id = ?
+"""
+
+_SQL_LIST_PATTERNS = """
+    SELECT id, name, category, duration_ms, intensity
+    FROM patterns ORDER BY name
+"""
+
+_SQL_LIST_PATTERNS_BY_CAT = """
+    SELECT id, name, category, duration_ms, intensity
+    FROM patterns WHERE category = ?
+    ORDER BY name
+"""
+
+
+# Digit runs orjson would parse differently from the stdlib (it reads
+# integers beyond 64 bits as floats)
+_LONG_DIGITS = re.compile(r"\d{19}")
+
+
+def _encode_sequence(sequence: List[Dict]) -> str:
+    """Serialize a step sequence for the `sequence` column
+    
+    Always the stdlib encoder: orjson rejects integers beyond 64 bits and
+    writes NaN as null, so stored text would depend on the environment.
+    """
+    return json.dumps(sequence, separators=(",", ":"))
+
+
+def _decode_sequence(data) -> List[Dict]:
+    """Deserialize a `sequence` column value, identically with or without orjson"""
+    if orjson is not None and not _LONG_DIGITS.search(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN written by the stdlib encoder
+    return json.loads(data)
+
+
+def _pack_intensity(intensity: float) -> int:
+    """Quantize a 0.0-1.0 intensity to a 0-255 integer"""
+    return round(intensity * 255)
+
+
+def _unpack_intensity(level: int) -> float:
+    """Expand a 0-255 intensity level back to 0.0-1.0 (two decimals)"""
+    return round(level / 255, 2)
+
+
+# Step type codes for the packed seq_types column; append only
+_STEP_TYPES = ("pulse", "buzz", "tap", "rumble")
+_STEP_TYPE_IDS = {name: i for i, name in enumerate(_STEP_TYPES)}
+
+
+# Step fields the packed columns can hold; any other key forces JSON storage
+_PACKED_STEP_KEYS = frozenset({"type", "duration_ms", "intensity", "pause_after_ms"})
+_MAX_U32 = 0xFFFFFFFF
+
+
+def _is_number(value) -> bool:
+    """True for finite real numbers (bools excluded)"""
+    if isinstance(value, bool) or not isinstance(value, Real):
+        return False
+    return isinstance(value, Integral) or math.isfinite(value)
+
+
+def _step_error(step: Dict) -> Optional[str]:
+    """Describe why a step's numeric fields are invalid, or None if they are valid"""
+    for key in ("duration_ms", "pause_after_ms"):
+        value = step.get(key, 0)
+        if not _is_number(value) or value < 0:
+            return f"Invalid {key}: {value!r}"
+    intensity = step.get("intensity", 0.5)
+    if not _is_number(intensity) or not 0 <= intensity <= 1:
+        return f"Invalid intensity: {intensity!r}"
+    return None
+
+
+def _is_packable(step: Dict) -> bool:
+    """Whether a step fits the packed columns (integral uint32 timings)"""
+    if not step.keys() <= _PACKED_STEP_KEYS or step.get("type") not in _STEP_TYPE_IDS:
+        return False
+    if _step_error(step):
+        return False
+    return all(
+        isinstance(step.get(key, 0), Integral) and step.get(key, 0) <= _MAX_U32
+        for key in ("duration_ms", "pause_after_ms")
+    )
+
+
+def _pack_sequence(sequence: List[Dict]) -> Optional[Tuple[bytes, bytes, bytes, bytes]]:
+    """Pack a step sequence into (types, durations, intensities, pauses) buffers
+    
+    Returns None when a step does not fit the packed columns: it carries
+    keys beyond the packed fields, an unknown type, or timings that are not
+    integers in the uint32 range. Intensities are quantized to 1/255 steps
+    (read back to two decimals), and missing durations and pauses are
+    stored as 0.
+    """
+    if not all(map(_is_packable, sequence)):
+        return None
+    n = len(sequence)
+    return (
+        struct.pack(f"<{n}B", *(_STEP_TYPE_IDS[s["type"]] for s in sequence)),
+        struct.pack(f"<{n}I", *(int(s.get("duration_ms", 0)) for s in sequence)),
+        struct.pack(f"<{n}B", *(_pack_intensity(s.get("intensity", 0.5)) for s in sequence)),
+        struct.pack(f"<{n}I", *(int(s.get("pause_after_ms", 0)) for s in sequence)),
+    )
+
+
+def _sequence_values(sequence: List[Dict]) -> tuple:
+    """Column values for (sequence, seq_types, seq_durations, seq_intensities, seq_pauses)"""
+    blobs = _pack_sequence(sequence)
+    if blobs is None:
+        return (_encode_sequence(sequence), None, None, None, None)
+    return (None, *blobs)
+
+
+def _unpack_columns(blobs: Tuple[bytes, bytes, bytes, bytes]) -> Tuple[tuple, tuple, tuple, tuple]:
+    """Unpack packed step buffers into parallel value tuples"""
+    types, durations, intensities, pauses = blobs
+    n = len(types)
+    return (
+        tuple(_STEP_TYPES[t] for t in types),
+        struct.unpack(f"<{n}I", durations),
+        tuple(map(_unpack_intensity, intensities)),
+        struct.unpack(f"<{n}I", pauses),
+    )
+
+
+def _unpack_sequence(blobs: Tuple[bytes, bytes, bytes, bytes]) -> List[Dict]:
+    """Rebuild the step dict list from packed step buffers"""
+    return [
+        {"type": t, "duration_ms": d, "intensity": i, "pause_after_ms": p}
+        for t, d, i, p in zip(*_unpack_columns(blobs))
+    ]
+
+
+def _row_blobs(row) -> Optional[Tuple[bytes, bytes, bytes, bytes]]:
+    """Packed step buffers of a pattern row, or None if its JSON steps don't pack"""
+    if row["seq_types"] is None:
+        return _pack_sequence(_decode_sequence(row["sequence"]))
+    return row["seq_types"], row["seq_durations"], row["seq_intensities"], row["seq_pauses"]
+
+
+def _row_steps(row) -> List[Dict]:
+    """Step dict list of a pattern row, whichever way it is stored"""
+    if row["seq_types"] is None:
+        return _decode_sequence(row["sequence"])
+    return _unpack_sequence(
+        (row["seq_types"], row["seq_durations"], row["seq_intensities"], row["seq_pauses"])
+    )
+
+
+def _row_columns(row) -> Tuple[tuple, tuple, tuple, tuple]:
+    """Parallel (types, durations, intensities, pauses) of a pattern row"""
+    if row["seq_types"] is None:
+        steps = _decode_sequence(row["sequence"])
+        return (
+            tuple(s["type"] for s in steps),
+            tuple(s.get("duration_ms", 0) for s in steps),
+            tuple(s.get("intensity", 0.5) for s in steps),
+            tuple(s.get("pause_after_ms", 0) for s in steps),
+        )
+    return _unpack_columns(
+        (row["seq_types"], row["seq_durations"], row["seq_intensities"], row["seq_pauses"])
+    )
+
+
+def _step_span(step: Dict) -> int:
+    """Time a single step occupies, including its trailing pause"""
+    return step.get("duration_ms", 0) + step.get("pause_after_ms", 0)
 
 
 @dataclass
@@ -29,8 +294,12 @@ class HapticPattern:
 class HapticEngine:
     """Haptic pattern composition and playback engine"""
     
-    VALID_CATEGORIES = {"notification", "game", "media", "accessibility", "navigation"}
-    VALID_SEQUENCE_TYPES = {"pulse", "buzz", "tap", "rumble"}
+    # Categories are stored as their index in this tuple; append only
+    CATEGORY_NAMES = ("accessibility", "game", "media", "navigation", "notification")
+    CATEGORY_IDS = {name: i for i, name in enumerate(CATEGORY_NAMES)}
+    
+    VALID_CATEGORIES = frozenset(CATEGORY_NAMES)
+    VALID_SEQUENCE_TYPES = frozenset(_STEP_TYPES)
     
     # Built-in preset patterns
     PRESETS = {
@@ -137,73 +406,163 @@ class HapticEngine:
         }
     }
     
+    # Preset sequences serialized once at import time
+    PRESET_SEQUENCE_BLOBS = {
+        name: _pack_sequence(data["sequence"]) for name, data in PRESETS.items()
+    }
+    PRESET_DURATION = {
+        name: sum(map(_step_span, data["sequence"])) * data.get("repeat", 1)
+        for name, data in PRESETS.items()
+    }
+    
     def __init__(self, db_path: str = "~/.blackroad/haptics.db"):
         self.db_path = Path(db_path).expanduser()
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self.conn: Optional[sqlite3.Connection] = None
+        self._log_buf: List[tuple] = []
+        self._log_flush_n = 64
         self._init_db()
         self._init_presets()
     
     def _init_db(self):
-        """Initialize SQLite database"""
-        self.conn = sqlite3.connect(str(self.db_path))
-        cursor = self.conn.cursor()
+        """Initialize SQLite database
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS patterns (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL UNIQUE,
-                category TEXT NOT NULL,
-                description TEXT,
-                sequence TEXT NOT NULL,
-                duration_ms INTEGER,
-                intensity REAL,
-                repeat INTEGER DEFAULT 1,
-                created_at TEXT,
-                preset BOOLEAN DEFAULT 0
-            )
-        """)
+        File databases are opened through a URI (mode=rwc) so open flags can
+        be set alongside the path. Shared cache is deliberately not enabled:
+        it adds table-level locks that fail writers while another engine is
+        iterating, whereas WAL already lets readers and a writer proceed
+        concurrently. SQLite's default serialized threading mode makes it
+        safe for callers sharing an engine across threads to reconnect with
+        check_same_thread=False.
+        """
+        if str(self.db_path) == ":memory:":
+            self.conn = sqlite3.connect(":memory:", cached_statements=256)
+        else:
+            uri = f"{self.db_path.resolve().as_uri()}?mode=rwc"
+            self.conn = sqlite3.connect(uri, uri=True, cached_statements=256)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.conn.execute("PRAGMA cache_size=-20000")
+        # Long-lived cursor shared by the single-statement methods
+        self._cur = self.conn.cursor()
+        cursor = self._cur
+        
+        # compose() walks the requested ids with JSON1 when SQLite has it
+        try:
+            cursor.execute("SELECT 1 FROM json_each('[]')")
+            self._has_json1 = True
+        except sqlite3.OperationalError as exc:
+            if "no such" not in str(exc):
+                raise
+            self._has_json1 = False
         
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patterns'")
+        if version < _SCHEMA_VERSION and cursor.fetchone():
+            self._migrate()
+        
+        cursor.execute(_SQL_CREATE_PATTERNS.format(table="patterns"))
+        
+        cursor.execute(_SQL_CREATE_PLAYBACK_LOG.format(table="playback_log"))
+        
+        # UNIQUE(name) already indexes the unfiltered ORDER BY name
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS playback_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                pattern_id TEXT NOT NULL,
-                device TEXT,
-                timestamp TEXT,
-                duration_ms INTEGER,
-                FOREIGN KEY(pattern_id) REFERENCES patterns(id)
-            )
+            CREATE INDEX IF NOT EXISTS idx_patterns_cat_name
+            ON patterns(category, name)
         """)
         
+        cursor.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self.conn.commit()
+    
+    def _migrate(self):
+        """Upgrade a database created by an older schema version"""
+        cursor = self._cur
+        # Take the write lock before reading the version, so a concurrent
+        # engine that raced us here sees our upgrade and skips its own
+        cursor.execute("BEGIN IMMEDIATE")
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version >= _SCHEMA_VERSION:
+            self.conn.commit()
+            return
+        # Column declarations (nullability, affinity) only change on a rebuild,
+        # so recreate the tables with the current layout before converting data
+        for table, create_sql in (("patterns", _SQL_CREATE_PATTERNS),
+                                  ("playback_log", _SQL_CREATE_PLAYBACK_LOG)):
+            columns = ", ".join(row["name"] for row in cursor.execute(f"PRAGMA table_info({table})"))
+            if not columns:
+                continue
+            cursor.execute(create_sql.format(table=f"{table}_new"))
+            cursor.execute(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}")
+            cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        if version < 2:
+            # Quantize intensities to uint8 levels
+            cursor.execute("""
+                UPDATE patterns SET intensity = CAST(ROUND(intensity * 255) AS INTEGER)
+                WHERE intensity IS NOT NULL
+            """)
+            rows = cursor.execute("""
+                SELECT id, seq_intensities FROM patterns WHERE seq_intensities IS NOT NULL
+            """).fetchall()
+            cursor.executemany(
+                "UPDATE patterns SET seq_intensities = ? WHERE id = ?",
+                [
+                    # Version 1 did not validate intensities, so clamp here
+                    (bytes(min(255, max(0, _pack_intensity(i)))
+                           for i in struct.unpack(f"<{len(blob) // 8}d", blob)), pid)
+                    for pid, blob in rows
+                ]
+            )
+        if version < 3:
+            # Replace category names with their integer codes
+            cursor.executemany(
+                "UPDATE patterns SET category = ? WHERE category = ?",
+                [(category_id, name) for name, category_id in self.CATEGORY_IDS.items()]
+            )
+        if version < 4:
+            # Timestamps used to be ISO text; the rebuild already turned numeric
+            # strings into integers, so only real ISO values are left as text
+            for table, column in (("patterns", "created_at"), ("playback_log", "timestamp")):
+                cursor.execute(f"""
+                    UPDATE {table} SET {column} = {_SQL_ISO_TO_MS.format(column=column)}
+                    WHERE typeof({column}) = 'text' AND julianday({column}) IS NOT NULL
+                """)
+        # Stamp the version in the same transaction: the conversions above
+        # are not idempotent and must never run twice
+        cursor.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
         self.conn.commit()
     
     def _init_presets(self):
         """Load preset patterns"""
-        cursor = self.conn.cursor()
-        for preset_name, preset_data in self.PRESETS.items():
-            cursor.execute("SELECT id FROM patterns WHERE name = ?", (preset_name,))
-            if not cursor.fetchone():
-                pattern_id = f"preset_{preset_name}"
-                cursor.execute("""
-                    INSERT INTO patterns 
-                    (id, name, category, description, sequence, duration_ms, intensity, repeat, preset)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
-                """, (
-                    pattern_id,
-                    preset_data["name"],
-                    preset_data["category"],
-                    preset_data["description"],
-                    json.dumps(preset_data["sequence"]),
-                    self._calculate_duration(preset_data["sequence"], preset_data.get("repeat", 1)),
-                    0.5,
-                    preset_data.get("repeat", 1)
-                ))
-        self.conn.commit()
+        cursor = self._cur
+        placeholders = ", ".join("?" * len(self.PRESETS))
+        cursor.execute(f"SELECT name FROM patterns WHERE name IN ({placeholders})",
+                       tuple(self.PRESETS))
+        existing = {row["name"] for row in cursor}
+        rows = [
+            (
+                f"preset_{preset_name}",
+                preset_data["name"],
+                self.CATEGORY_IDS[preset_data["category"]],
+                preset_data["description"],
+                *self.PRESET_SEQUENCE_BLOBS[preset_name],
+                self.PRESET_DURATION[preset_name],
+                _pack_intensity(0.5),
+                preset_data.get("repeat", 1)
+            )
+            for preset_name, preset_data in self.PRESETS.items()
+            if preset_name not in existing
+        ]
+        if rows:
+            cursor.executemany(_SQL_INSERT_PRESET, rows)
+            self.conn.commit()
     
     def _calculate_duration(self, sequence: List[Dict], repeat: int = 1) -> int:
         """Calculate total pattern duration"""
-        total = sum(s.get("duration_ms", 0) + s.get("pause_after_ms", 0) for s in sequence)
-        return total * repeat
+        return sum(map(_step_span, sequence)) * repeat
     
     def create_pattern(self, name: str, category: str, sequence: List[Dict], 
                        description: str = "", repeat: int = 1) -> str:
@@ -211,139 +570,136 @@ class HapticEngine:
         if category not in self.VALID_CATEGORIES:
             raise ValueError(f"Invalid category: {category}")
         
+        types = {step.get("type") for step in sequence}
+        if not types.issubset(self.VALID_SEQUENCE_TYPES):
+            invalid = ", ".join(sorted(map(str, types - self.VALID_SEQUENCE_TYPES)))
+            raise ValueError(f"Invalid sequence type: {invalid}")
+        
         for step in sequence:
-            if step.get("type") not in self.VALID_SEQUENCE_TYPES:
-                raise ValueError(f"Invalid sequence type: {step.get('type')}")
+            error = _step_error(step)
+            if error:
+                raise ValueError(error)
         
-        pattern_id = f"pattern_{name.lower().replace(' ', '_')}_{int(datetime.now().timestamp() * 1000) % 10000}"
+        now = time_ns() // 1_000_000
+        pattern_id = f"pattern_{name.translate(_LOWER_UNDERSCORE)}_{now % 10000}"
         duration_ms = self._calculate_duration(sequence, repeat)
-        now = datetime.now().isoformat()
         
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO patterns 
-            (id, name, category, description, sequence, duration_ms, intensity, repeat, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (pattern_id, name, category, description, json.dumps(sequence), 
-              duration_ms, 0.5, repeat, now))
+        cursor = self._cur
+        cursor.execute(_SQL_INSERT_PATTERN, (
+            pattern_id, name, self.CATEGORY_IDS[category], description,
+            *_sequence_values(sequence), duration_ms, _pack_intensity(0.5), repeat, now
+        ))
         self.conn.commit()
         
         return pattern_id
     
-    def play(self, pattern_id: str, device: str = "default") -> Dict:
-        """Simulate pattern playback"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT sequence, duration_ms FROM patterns WHERE id = ?
-        """, (pattern_id,))
+    def play(self, pattern_id: str, device: str = "default", log: bool = True,
+             build_timeline: bool = True) -> Dict:
+        """Simulate pattern playback
+        
+        Previews can pass log=False to skip the playback log, and
+        build_timeline=False when only the total duration is needed.
+        """
+        cursor = self._cur
+        cursor.execute(_SQL_GET_SEQUENCE, (pattern_id,))
         
         row = cursor.fetchone()
         if not row:
             return {"error": f"Pattern {pattern_id} not found"}
         
-        sequence = json.loads(row[0])
-        duration_ms = row[1]
-        
-        # Log playback
-        cursor.execute("""
-            INSERT INTO playback_log (pattern_id, device, timestamp, duration_ms)
-            VALUES (?, ?, ?, ?)
-        """, (pattern_id, device, datetime.now().isoformat(), duration_ms))
-        self.conn.commit()
-        
-        # Generate timeline
-        timeline = []
-        current_time = 0
-        for step in sequence:
-            timeline.append({
-                "time_ms": current_time,
-                "type": step["type"],
-                "duration_ms": step["duration_ms"],
-                "intensity": step["intensity"]
-            })
-            current_time += step["duration_ms"] + step.get("pause_after_ms", 0)
-        
-        return {
+        duration_ms = row["duration_ms"]
+        result = {
             "pattern_id": pattern_id,
             "device": device,
-            "total_duration_ms": duration_ms,
-            "timeline": timeline
+            "total_duration_ms": duration_ms
         }
+        
+        if log:
+            # Buffered, written in batches by flush()
+            self._log_buf.append((pattern_id, device, time_ns() // 1_000_000, duration_ms))
+            if len(self._log_buf) >= self._log_flush_n:
+                self.flush()
+        
+        if build_timeline:
+            # Generate timeline from running step offsets
+            types, durations, intensities, pauses = _row_columns(row)
+            starts = accumulate(map(add, durations, pauses), initial=0)
+            result["timeline"] = [
+                {
+                    "time_ms": time_ms,
+                    "type": step_type,
+                    "duration_ms": step_duration,
+                    "intensity": step_intensity
+                }
+                for time_ms, step_type, step_duration, step_intensity
+                in zip(starts, types, durations, intensities)
+            ]
+        
+        return result
     
     def compose(self, pattern_ids: List[str]) -> str:
         """Chain multiple patterns into one"""
-        cursor = self.conn.cursor()
-        combined_sequence = []
-        total_duration = 0
-        
-        for pid in pattern_ids:
-            cursor.execute("SELECT sequence, duration_ms FROM patterns WHERE id = ?", (pid,))
-            row = cursor.fetchone()
-            if row:
-                combined_sequence.extend(json.loads(row[0]))
-                total_duration += row[1]
+        cursor = self._cur
+        if self._has_json1:
+            rows = cursor.execute(_SQL_GET_SEQUENCES, (json.dumps(pattern_ids),)).fetchall()
+        else:
+            # SQLite built without JSON1: look the patterns up one by one
+            rows = [cursor.execute(_SQL_GET_SEQUENCE, (pid,)).fetchone() for pid in pattern_ids]
+            rows = [row for row in rows if row]
         
-        composed_id = f"composed_{int(datetime.now().timestamp() * 1000)}"
-        now = datetime.now().isoformat()
+        packed = [_row_blobs(row) for row in rows]
+        if all(blobs is not None for blobs in packed):
+            # Packed step buffers concatenate directly, no per-step decoding
+            values = (None, *(tuple(map(b"".join, zip(*packed))) or (b"",) * 4))
+        else:
+            # Some steps only exist as JSON: chain the step lists instead
+            values = (_encode_sequence([step for row in rows for step in _row_steps(row)]),
+                      None, None, None, None)
+        total_duration = sum(row["duration_ms"] for row in rows)
         
-        cursor.execute("""
-            INSERT INTO patterns 
-            (id, name, category, description, sequence, duration_ms, intensity, repeat, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (composed_id, "Composed", "notification", "Composed pattern", 
-              json.dumps(combined_sequence), total_duration, 0.5, 1, now))
+        now = time_ns() // 1_000_000
+        composed_id = f"composed_{now}"
+        cursor.execute(_SQL_INSERT_PATTERN, (
+            composed_id, "Composed", self.CATEGORY_IDS["notification"], "Composed pattern", *values,
+            total_duration, _pack_intensity(0.5), 1, now
+        ))
         self.conn.commit()
         
         return composed_id
     
     def get_pattern(self, pattern_id: str) -> Optional[Dict]:
         """Retrieve pattern details"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT id, name, category, description, sequence, duration_ms, intensity, repeat
-            FROM patterns WHERE id = ?
-        """, (pattern_id,))
+        cursor = self._cur
+        cursor.execute(_SQL_GET_PATTERN, (pattern_id,))
         
         row = cursor.fetchone()
         if row:
-            return {
-                "id": row[0],
-                "name": row[1],
-                "category": row[2],
-                "description": row[3],
-                "sequence": json.loads(row[4]),
-                "duration_ms": row[5],
-                "intensity": row[6],
-                "repeat": row[7]
-            }
+            pattern = {key: row[key] for key in row.keys() if not key.startswith("seq_")}
+            pattern["category"] = self.CATEGORY_NAMES[pattern["category"]]
+            pattern["intensity"] = _unpack_intensity(pattern["intensity"])
+            pattern["sequence"] = _row_steps(row)
+            return pattern
         return None
     
-    def list_patterns(self, category: Optional[str] = None) -> List[Dict]:
-        """List all patterns, optionally filtered by category"""
+    def list_patterns(self, category: Optional[str] = None) -> Iterator[Dict]:
+        """Lazily yield all patterns, optionally filtered by category"""
+        # Own cursor: the shared one would be clobbered mid-iteration
         cursor = self.conn.cursor()
         
         if category:
-            cursor.execute("""
-                SELECT id, name, category, duration_ms, intensity
-                FROM patterns WHERE category = ?
-                ORDER BY name
-            """, (category,))
+            category_id = self.CATEGORY_IDS.get(category)
+            if category_id is None:
+                return iter(())
+            cursor.execute(_SQL_LIST_PATTERNS_BY_CAT, (category_id,))
         else:
-            cursor.execute("""
-                SELECT id, name, category, duration_ms, intensity
-                FROM patterns ORDER BY name
-            """)
+            cursor.execute(_SQL_LIST_PATTERNS)
         
-        return [
-            {
-                "id": row[0],
-                "name": row[1],
-                "category": row[2],
-                "duration_ms": row[3],
-                "intensity": row[4]
-            }
-            for row in cursor.fetchall()
-        ]
+        names = self.CATEGORY_NAMES
+        return (
+            {**row, "category": names[row["category"]],
+             "intensity": _unpack_intensity(row["intensity"])}
+            for row in cursor
+        )
     
     def export_json(self, pattern_id: str) -> Dict:
         """Export pattern in device SDK format"""
@@ -387,9 +743,17 @@ class HapticEngine:
                 patterns[name] = pattern
         return patterns
     
+    def flush(self):
+        """Write buffered playback log entries to the database"""
+        if self._log_buf:
+            self._cur.executemany(_SQL_INSERT_PLAYBACK, self._log_buf)
+            self.conn.commit()
+            self._log_buf.clear()
+    
     def close(self):
-        """Close database"""
+        """Flush pending log entries and close database"""
         if self.conn:
+            self.flush()
             self.conn.close()
 
 
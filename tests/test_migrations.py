@@ -0,0 +1,165 @@
+"""
+Schema migration tests: databases written by the original (version 0)
+schema must survive the upgrade with their data intact.
+"""
+
+import json
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from haptic_engine import HapticEngine, _SCHEMA_VERSION  # noqa: E402
+
+
+# Schema exactly as the first release created it
+BASELINE_SCHEMA = """
+    CREATE TABLE patterns (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        category TEXT NOT NULL,
+        description TEXT,
+        sequence TEXT NOT NULL,
+        duration_ms INTEGER,
+        intensity REAL,
+        repeat INTEGER DEFAULT 1,
+        created_at TEXT,
+        preset BOOLEAN DEFAULT 0
+    );
+    CREATE TABLE playback_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pattern_id TEXT NOT NULL,
+        device TEXT,
+        timestamp TEXT,
+        duration_ms INTEGER,
+        FOREIGN KEY(pattern_id) REFERENCES patterns(id)
+    );
+"""
+
+CREATED_AT = "2026-03-01T09:30:15.250000"
+PLAYED_AT = "2026-03-01T09:31:00.500000"
+
+LEGACY_PATTERNS = {
+    "pattern_pulse_1234": ("pulse", "game", [
+        {"type": "pulse", "duration_ms": 100, "intensity": 0.8, "pause_after_ms": 50},
+        {"type": "buzz", "duration_ms": 200, "intensity": 0.35, "pause_after_ms": 0},
+    ]),
+    "pattern_fraction_5678": ("fraction", "media", [
+        {"type": "tap", "duration_ms": 12.5, "intensity": 0.4},
+    ]),
+    "pattern_extra_9012": ("extra", "navigation", [
+        {"type": "rumble", "duration_ms": 30, "intensity": 1.0, "pause_after_ms": 10, "extra": 1},
+    ]),
+}
+
+
+def _local_ms(iso: str) -> int:
+    """Unix ms of a naive local-time ISO string, as the baseline wrote them"""
+    return round(datetime.fromisoformat(iso).timestamp() * 1000)
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """A database written with the original schema and storage formats"""
+    path = tmp_path / "haptics.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    for pattern_id, (name, category, sequence) in LEGACY_PATTERNS.items():
+        duration = sum(s["duration_ms"] + s.get("pause_after_ms", 0) for s in sequence)
+        conn.execute(
+            "INSERT INTO patterns "
+            "(id, name, category, description, sequence, duration_ms, intensity, repeat, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (pattern_id, name, category, "", json.dumps(sequence), duration, 0.5, 1, CREATED_AT)
+        )
+    conn.execute(
+        "INSERT INTO playback_log (pattern_id, device, timestamp, duration_ms) VALUES (?, ?, ?, ?)",
+        ("pattern_pulse_1234", "default", PLAYED_AT, 350)
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_upgrade_stamps_current_version(baseline_db):
+    HapticEngine(str(baseline_db)).close()
+    conn = sqlite3.connect(baseline_db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == _SCHEMA_VERSION
+
+
+def test_upgrade_preserves_patterns(baseline_db):
+    engine = HapticEngine(str(baseline_db))
+    try:
+        for pattern_id, (name, category, sequence) in LEGACY_PATTERNS.items():
+            pattern = engine.get_pattern(pattern_id)
+            assert pattern["name"] == name
+            assert pattern["category"] == category
+            assert pattern["intensity"] == 0.5
+            assert pattern["sequence"] == sequence
+
+        assert "pattern_fraction_5678" in [p["id"] for p in engine.list_patterns("media")]
+        timeline = engine.play("pattern_pulse_1234", log=False)["timeline"]
+        assert [step["time_ms"] for step in timeline] == [0, 150]
+        assert [step["intensity"] for step in timeline] == [0.8, 0.35]
+        assert engine.get_pattern("preset_rain")["sequence"] == HapticEngine.PRESETS["rain"]["sequence"]
+    finally:
+        engine.close()
+
+
+def test_upgrade_converts_stored_types(baseline_db):
+    HapticEngine(str(baseline_db)).close()
+    conn = sqlite3.connect(baseline_db)
+    rows = conn.execute(
+        "SELECT category, intensity FROM patterns WHERE id LIKE 'pattern_%'"
+    ).fetchall()
+    assert {category for category, _ in rows} == {
+        HapticEngine.CATEGORY_IDS[category] for _, category, _ in LEGACY_PATTERNS.values()
+    }
+    assert {intensity for _, intensity in rows} == {128}
+
+
+def test_upgrade_converts_timestamps(baseline_db):
+    HapticEngine(str(baseline_db)).close()
+    conn = sqlite3.connect(baseline_db)
+    created = conn.execute(
+        "SELECT DISTINCT created_at FROM patterns WHERE id LIKE 'pattern_%'"
+    ).fetchall()
+    assert created == [(_local_ms(CREATED_AT),)]
+    assert conn.execute("SELECT timestamp FROM playback_log").fetchall() == [(_local_ms(PLAYED_AT),)]
+    assert "timestamp INTEGER" in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'playback_log'"
+    ).fetchone()[0]
+
+
+def test_concurrent_open_migrates_once(baseline_db, monkeypatch):
+    # Hold both engines between reading the stale version and migrating
+    migrate = HapticEngine._migrate
+    def slow_migrate(self):
+        time.sleep(0.2)
+        migrate(self)
+    monkeypatch.setattr(HapticEngine, "_migrate", slow_migrate)
+
+    errors = []
+    def open_engine():
+        try:
+            HapticEngine(str(baseline_db)).close()
+        except Exception as exc:
+            errors.append(exc)
+    threads = [threading.Thread(target=open_engine) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    conn = sqlite3.connect(baseline_db)
+    assert conn.execute("SELECT DISTINCT intensity FROM patterns").fetchall() == [(128,)]
+    assert conn.execute("SELECT DISTINCT created_at FROM patterns WHERE created_at IS NOT NULL").fetchall() == [
+        (_local_ms(CREATED_AT),)
+    ]